@@ -1,24 +1,56 @@
 """
 Define Clients, Resources and utilities for interfacing with AWS.
+
+Clients and resources are created on first access (PEP 562 module ``__getattr__``)
+so that importing the package does not pay for boto3 client construction.
 """
-from typing import Tuple
-from urllib.parse import urlparse
+import threading
+from typing import Any, Callable, Dict, Tuple
 
 import boto3
+from botocore.config import Config
 
 from . import settings
 
-S3_CLIENT = boto3.client("s3", endpoint_url=settings.AWS_SERVICE_ENDPOINTS["s3"])
-S3_RESOURCE = boto3.resource("s3", endpoint_url=settings.AWS_SERVICE_ENDPOINTS["s3"])
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+_CACHE: Dict[str, Any] = {}
+
+# CostExplorer is heavily rate limited, back off adaptively on throttling instead of failing the report
+CE_CLIENT_CONFIG = Config(retries={"max_attempts": 10, "mode": "adaptive"}, max_pool_connections=16, connect_timeout=5, read_timeout=30)
+
+
+def _get_session() -> boto3.session.Session:
+    """Get the boto3 Session shared by all clients and resources."""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = boto3.session.Session()
+    return _SESSION
+
+
+_FACTORIES: Dict[str, Callable[[], Any]] = {
+    "S3_CLIENT": lambda: _get_session().client("s3", endpoint_url=settings.AWS_SERVICE_ENDPOINTS["s3"]),
+    "S3_RESOURCE": lambda: _get_session().resource("s3", endpoint_url=settings.AWS_SERVICE_ENDPOINTS["s3"]),
+    "CE_CLIENT": lambda: _get_session().client("ce", config=CE_CLIENT_CONFIG),
+}
+
 
-CE_CLIENT = boto3.client("ce")
+def __getattr__(name: str) -> Any:
+    """Create the requested client/resource on first access and cache it."""
+    if name not in _FACTORIES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name not in _CACHE:
+        # boto3 Session objects are not thread-safe, serialize client creation
+        with _SESSION_LOCK:
+            if name not in _CACHE:
+                _CACHE[name] = _FACTORIES[name]()
+    return _CACHE[name]
 
 
 def parse_s3_uri(uri: str) -> Tuple[str, str]:
     """
     Parse s3 uri (s3://bucket/key) to (bucket, key).
     """
-    result = urlparse(uri)
-    bucket = result.netloc
-    key = result.path[1:]  # removes leading slash
+    _, _, bucket_and_key = uri.partition("://")
+    bucket, _, key = bucket_and_key.partition("/")  # removes leading slash from key
     return bucket, key
@@ -11,3 +11,9 @@ class SlackChannelError(Exception):
     """Raise when Slack Channel not found."""
 
     pass
+
+
+class ReportError(Exception):
+    """Raise when one or more reports could not be prepared or posted."""
+
+    pass
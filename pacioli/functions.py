@@ -4,22 +4,31 @@ Contains main functions for performing collection and generation of charts for p
 import datetime
 import json
 import logging
-from io import BytesIO
+import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
-from . import settings
-from .aws import S3_CLIENT, parse_s3_uri
+from botocore.exceptions import ClientError
+
+from . import aws, settings
+from .aws import parse_s3_uri
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_ACCOUNTID_MAPPING_FILENAME = "accountid_mapping.json"
 DEFAULT_ACCOUNTID_MAPPING_FILEPATH = Path(__file__).resolve().parent.parent / DEFAULT_ACCOUNTID_MAPPING_FILENAME
 
+# slack rejects messages with more than 50 blocks
+SLACK_MAX_BLOCKS = 50
+
+# {MAPPING_S3_URI: (VALIDATED_MONOTONIC_TIME, ETAG, MAPPING)}
+TAG_DISPLAY_MAPPING_CACHE: Dict[str, Tuple[float, str, dict]] = {}
+
 
 def datestr2datetime(date_str) -> datetime.datetime:
     """Convert YYYY-MM-DD to a python datetime object."""
-    return datetime.datetime.strptime(date_str, "%Y-%m-%d")
+    # fromisoformat() is implemented in C and avoids strptime()'s format parsing
+    return datetime.datetime.fromisoformat(date_str)
 
 
 def get_month_starts(current_datetime: Optional[datetime.datetime] = None) -> Tuple[datetime.date, datetime.date, datetime.date]:
@@ -40,32 +49,61 @@ def get_month_starts(current_datetime: Optional[datetime.datetime] = None) -> Tu
     return most_recent_full_date, current_month_start, previous_month_start
 
 
-def get_tag_display_mapping(mapping_s3_uri: str = settings.GROUPBY_TAG_DISPLAY_MAPPING_S3_URI) -> dict:
+def get_tag_display_mapping(
+    mapping_s3_uri: str = settings.GROUPBY_TAG_DISPLAY_MAPPING_S3_URI, ttl_seconds: int = settings.TAG_DISPLAY_MAPPING_CACHE_TTL_SECONDS
+) -> dict:
     """
     mapping_s3_uri is a JSON file that maps the Billing GroupBy Key to the desired display value.
+
+    Successfully loaded mappings are cached in-process for `ttl_seconds`,
+    after which the object is conditionally re-downloaded (If-None-Match) only if its ETag changed.
+    If a refresh fails the previously loaded mapping is used.
     """
     mapping = {}
     if mapping_s3_uri:
-        logger.info(f"retrieving {mapping_s3_uri} ...")
+        cached = TAG_DISPLAY_MAPPING_CACHE.get(mapping_s3_uri)
+        if cached and time.monotonic() - cached[0] < ttl_seconds:
+            logger.debug("using cached %s", mapping_s3_uri)
+            return cached[2]
+
+        logger.info("retrieving %s ...", mapping_s3_uri)
         bucket, key = parse_s3_uri(mapping_s3_uri)
+        loaded = False
+        request = {"Bucket": bucket, "Key": key}
+        if cached:
+            request["IfNoneMatch"] = cached[1]
         try:
-            buffer = BytesIO()
-            S3_CLIENT.download_fileobj(Bucket=bucket, Key=key, Fileobj=buffer)
-            contents = buffer.getvalue().decode("utf8")
-            logger.info(f"retrieving {mapping_s3_uri} ... SUCCESS")
+            try:
+                # small object, a single GET avoids the multipart transfer manager
+                response = aws.S3_CLIENT.get_object(**request)
+            except ClientError as e:
+                if cached and e.response["Error"]["Code"] in ("304", "NotModified"):
+                    logger.info("%s unchanged, using cached", mapping_s3_uri)
+                    TAG_DISPLAY_MAPPING_CACHE[mapping_s3_uri] = (time.monotonic(), cached[1], cached[2])
+                    return cached[2]
+                raise
+            etag = response["ETag"]
+            contents = response["Body"].read()
+            logger.info("retrieving %s ... SUCCESS", mapping_s3_uri)
             # load contents to mapping dictionary
             try:
-                logger.info(f"loading {mapping_s3_uri} ... ")
+                logger.info("loading %s ... ", mapping_s3_uri)
                 mapping = json.loads(contents)
-                logger.info(f"loading {mapping_s3_uri} ... SUCCESS")
+                loaded = True
+                TAG_DISPLAY_MAPPING_CACHE[mapping_s3_uri] = (time.monotonic(), etag, mapping)
+                logger.info("loading %s ... SUCCESS", mapping_s3_uri)
             except json.JSONDecodeError as e:
                 logger.exception(e)
-                logger.error(f"retrieving {mapping_s3_uri} ... ERROR")
-                logger.error(f"Unable to decode {mapping_s3_uri} content as JSON: {contents}")
+                logger.error("retrieving %s ... ERROR", mapping_s3_uri)
+                logger.error("Unable to decode %s content as JSON: %s", mapping_s3_uri, contents.decode("utf8", errors="replace"))
         except Exception as e:
             logger.exception(e)
-            logger.warning(f"{mapping_s3_uri} not found!")
-            logger.error(f"retrieving {mapping_s3_uri} ... ERROR")
+            logger.warning("%s not found!", mapping_s3_uri)
+            logger.error("retrieving %s ... ERROR", mapping_s3_uri)
+
+        if not loaded and cached:
+            logger.warning("using previously retrieved %s", mapping_s3_uri)
+            mapping = cached[2]
     return mapping
 
 
@@ -74,25 +112,34 @@ def get_accounttotals_message_blocks(accounts: list[dict], display_datetime: Opt
     Prepare account totals message blocks for post to slack
     """
     dollar_emoji = ":heavy_dollar_sign:"
-    previous_total = sum(a["previous_cost"] for a in accounts)
+    previous_total = sum(a["previous_cost"] for a in accounts if a["previous_cost"])
     current_total = sum(a["current_cost"] for a in accounts)
-    total_change = round((current_total / previous_total - 1.0) * 100, 1)
-    direction = ""
-    if total_change > 0:
-        direction = "+"
-    title = f"*管理アカウント（月合計）{display_datetime}* ${current_total:15.2f} {direction}{total_change}%"
+    total_change_display = "-"
+    if previous_total:
+        total_change = round((current_total / previous_total - 1.0) * 100, 1)
+        direction = ""
+        if total_change > 0:
+            direction = "+"
+        total_change_display = f"{direction}{total_change}%"
+    title = f"*管理アカウント（月合計）{display_datetime}* ${current_total:15.2f} {total_change_display}"
     divider_element = {"type": "divider"}
     json_formatted_message = [{"type": "section", "text": {"type": "mrkdwn", "text": title}}, divider_element]
     for account_info in accounts:
         name = account_info["name"]
         account_id = account_info["id"]
-        direction = ""
+        change_display = "-"
         change = account_info["percentage_change"]
-        if change > 0:
-            direction = "+"
-        display_name = f"{name} ({account_id}) {direction}{change}%"
+        if change is not None:
+            direction = ""
+            if change > 0:
+                direction = "+"
+            change_display = f"{direction}{change}%"
+        display_name = f"{name} ({account_id}) {change_display}"
         account_total = account_info["current_cost"]
-        multiplier = int(5 * (account_total / current_total))
+        multiplier = 0
+        if current_total:
+            # NOTE: keep the division per row, (5 / total) * cost may round the largest entry down
+            multiplier = int(5 * (account_total / current_total))
         dollar_emojis = "-"
         if int(account_total) > 0:
             dollar_emojis = dollar_emoji * (multiplier + 1)
@@ -123,6 +170,9 @@ def get_projecttotals_message_blocks(projects: list[dict], display_datetime: Opt
     total = sum(p["current_cost"] for p in projects)
     null_project_ids = ("nothing_project_tag", "")
     for project_info in projects:
+        if len(json_formatted_message) >= SLACK_MAX_BLOCKS:
+            # remaining projects would be truncated below, skip rendering them
+            break
         project_total = project_info["current_cost"]
         project_name = project_info["name"]
         project_id = project_info["id"]
@@ -133,7 +183,9 @@ def get_projecttotals_message_blocks(projects: list[dict], display_datetime: Opt
             logger.info(f"tax subtracted from tagless: {project_total} - {tax} = {project_total - tax}")
             project_total = project_total - tax
 
-        multiplier = int(5 * (project_total / total))
+        multiplier = 0
+        if total:
+            multiplier = int(5 * (project_total / total))
         dollar_emojis = "-"
         if int(project_total) > 0:
             dollar_emojis = dollar_emoji * (multiplier + 1)
@@ -156,9 +208,9 @@ def get_projecttotals_message_blocks(projects: list[dict], display_datetime: Opt
         json_formatted_message.append(project_section)
         json_formatted_message.append(divider_element)
 
-    if len(json_formatted_message) > 50:
-        logger.warning(f"len(json_formatted_message) {len(json_formatted_message) > 50} > 50, truncating json_formatted_message!")
-        json_formatted_message = json_formatted_message[:50]
+    if len(json_formatted_message) > SLACK_MAX_BLOCKS:
+        logger.warning(f"len(json_formatted_message) {len(json_formatted_message)} > {SLACK_MAX_BLOCKS}, truncating json_formatted_message!")
+        json_formatted_message = json_formatted_message[:SLACK_MAX_BLOCKS]
     return title, json_formatted_message
 
 
@@ -184,19 +236,12 @@ def get_topn_projectservices_message_blocks(
             project_id_display = f"({project_id})"
         project_display_name = f"_*{count}. {project_name}* {project_id_display} ${current_cost:15.2f}_"
 
-        project_fields = [{"type": "mrkdwn", "text": f"_{name} ${cost:.2f}_"} for name, cost in project_info["services"]]
-        if len(project_fields) > 10:
-            logger.warning(f"len(project_fields) {len(project_fields)} > 10, truncating...")
-            top9 = project_fields[:9]
-            remaining = project_fields[9:]
-            others_cost = 0
-            for entry in remaining:
-                # parse text to cost
-                remaining_cost = float(entry["text"].split("$")[-1].replace("_", ""))
-                others_cost += remaining_cost
-            others = {"type": "mrkdwn", "text": f"_Others ${others_cost:.2f}_"}
-            project_fields = top9
-            project_fields.append(others)
+        services = project_info["services"]
+        if len(services) > 10:
+            logger.warning(f"len(services) {len(services)} > 10, truncating...")
+            others_cost = sum(cost for _, cost in services[9:])
+            services = services[:9] + [("Others", others_cost)]
+        project_fields = [{"type": "mrkdwn", "text": f"_{name} ${cost:.2f}_"} for name, cost in services]
         project_section = {
             "type": "section",
             "text": {"text": project_display_name, "type": "mrkdwn"},
@@ -207,13 +252,25 @@ def get_topn_projectservices_message_blocks(
     return title, json_formatted_message
 
 
-def get_accountid_mapping() -> dict:
+def load_accountid_mapping(filepath: Path = DEFAULT_ACCOUNTID_MAPPING_FILEPATH) -> dict:
     """
-    Get the accountid mapping dictionary
+    Load the accountid mapping dictionary from the given JSON file
     """
     accountid_mapping = {}
-    logger.debug(f"DEFAULT_ACCOUNTID_MAPPING_FILEPATH={DEFAULT_ACCOUNTID_MAPPING_FILEPATH}")
-    logger.debug(f"DEFAULT_ACCOUNTID_MAPPING_FILEPATH.exists()={DEFAULT_ACCOUNTID_MAPPING_FILEPATH.exists()}")
-    if DEFAULT_ACCOUNTID_MAPPING_FILEPATH.exists():
-        accountid_mapping = json.loads(DEFAULT_ACCOUNTID_MAPPING_FILEPATH.read_text(encoding="utf8"))
+    logger.debug(f"filepath={filepath}")
+    logger.debug(f"filepath.exists()={filepath.exists()}")
+    if filepath.exists():
+        with filepath.open(encoding="utf8") as mapping:
+            accountid_mapping = json.load(mapping)
     return accountid_mapping
+
+
+# mapping file is static per deployment, load once per (lambda) container
+ACCOUNTID_MAPPING = load_accountid_mapping()
+
+
+def get_accountid_mapping() -> dict:
+    """
+    Get the accountid mapping dictionary
+    """
+    return ACCOUNTID_MAPPING
@@ -5,68 +5,85 @@ import datetime
 import logging
 import pprint
 import sys
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
 
+from ..exceptions import ReportError
 from ..functions import get_accounttotals_message_blocks, get_projecttotals_message_blocks, get_topn_projectservices_message_blocks
 from ..managers import ReportManager
 from ..reporting.slack import SlackPostManager
 from ..settings import DISPLAY_TIMEZONE, LOG_LEVEL, PROJECTSERVICES_TOPN, SLACK_CHANNEL_NAME
 
-DEFAULT_ACCOUNTID_MAPPING_FILENAME = "accountid_mapping.json"
-DEFAULT_ACCOUNTID_MAPPING_FILEPATH = Path(__file__).resolve().parent.parent.parent / DEFAULT_ACCOUNTID_MAPPING_FILENAME
-
 logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL, format="%(asctime)s [%(levelname)s] (%(name)s) %(funcName)s: %(message)s")
 logging.getLogger("botocore").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+# created once per (lambda) container, warm invocations reuse the client and resolved channel ids
+SLACK_POST_MANAGER = SlackPostManager()
+
+
+def _post_report(name: str, get_results: Callable[[], Any], build_blocks: Callable[[Any], Tuple[str, List[dict]]], post_to_slack: bool) -> None:
+    """Build the Slack blocks for a single report from its results and post them."""
+    results = get_results()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s:", name)
+        logger.debug(pprint.pformat(results, indent=4))
+    title, blocks = build_blocks(results)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s_blocks:", name)
+        logger.debug(pprint.pformat(blocks, indent=4))
+    if post_to_slack:
+        logger.info("posting %s_blocks to slack...", name)
+        SLACK_POST_MANAGER.post_message_to_channel(channel_name=SLACK_CHANNEL_NAME, message=title, blocks=blocks)
+        logger.info("posting %s_blocks to slack... DONE", name)
+
 
 def post_status(event, context) -> None:
     """
     Handle the lambda event, create chart, chart image and post to slack.
     """
     post_to_slack = event.get("post_to_slack", True)
-    logger.debug(f"post_to_slack={post_to_slack}")
+    logger.debug("post_to_slack=%s", post_to_slack)
     now = datetime.datetime.now(datetime.timezone.utc)
     display_datetime = now.astimezone(DISPLAY_TIMEZONE).strftime("%m/%d %H:%M (%Z)")
     rm = ReportManager(generation_datetime=now)
 
-    logger.info("posting to slack...")
-    slack = SlackPostManager()
+    # collect reports concurrently, each report waits on independent CostExplorer requests
+    # -- each report is posted as soon as its own results are available, in order,
+    #    so a failing report does not prevent the others from being posted
+    failed = {}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        account_totals_future = executor.submit(rm.generate_accounts_report)
+        tax_future = executor.submit(rm.get_period_total_tax)
+        project_totals_future = executor.submit(rm.generate_projectid_report)
+        project_services_future = executor.submit(rm.generate_projectid_itemized_report)
 
-    # prepare accounts report
-    account_totals = rm.generate_accounts_report()
-    logger.debug("rm.generate_accounts_report() account_totals:")
-    logger.debug(pprint.pformat(account_totals, indent=4))
-    title, account_totals_blocks = get_accounttotals_message_blocks(account_totals, display_datetime)
-    logger.debug("account_totals_blocks:")
-    logger.debug(pprint.pformat(account_totals_blocks, indent=4))
-    if post_to_slack:
-        logger.info("posting account_totals_blocks to slack...")
-        slack.post_message_to_channel(channel_name=SLACK_CHANNEL_NAME, message=title, blocks=account_totals_blocks)
-        logger.info("posting account_totals_blocks to slack... DONE")
-
-    # prepare projects report
-    tax = rm.get_period_total_tax()
-    project_totals = rm.generate_projectid_report()
-    logger.debug("rm.generate_projectid_report() project_totals:")
-    logger.debug(pprint.pformat(project_totals, indent=4))
-    title, project_totals_blocks = get_projecttotals_message_blocks(project_totals, display_datetime, tax=tax)
-    logger.debug("project_totals_blocks:")
-    logger.debug(pprint.pformat(project_totals_blocks, indent=4))
-    if post_to_slack:
-        logger.info("posting project_totals_blocks to slack...")
-        slack.post_message_to_channel(channel_name=SLACK_CHANNEL_NAME, message=title, blocks=project_totals_blocks)
-        logger.info("posting project_totals_blocks to slack... DONE")
+        reports = (
+            (
+                "account_totals",
+                account_totals_future.result,
+                lambda account_totals: get_accounttotals_message_blocks(account_totals, display_datetime),
+            ),
+            (
+                "project_totals",
+                project_totals_future.result,
+                lambda project_totals: get_projecttotals_message_blocks(project_totals, display_datetime, tax=tax_future.result()),
+            ),
+            (
+                "projectservice_totals",
+                project_services_future.result,
+                lambda project_services: get_topn_projectservices_message_blocks(project_services, display_datetime, topn=PROJECTSERVICES_TOPN),
+            ),
+        )
+        for name, get_results, build_blocks in reports:
+            try:
+                _post_report(name, get_results, build_blocks, post_to_slack)
+            except Exception as e:
+                logger.exception(e)
+                logger.error("%s report ... ERROR", name)
+                failed[name] = e
 
-    # prepare top N projects breakdown report
-    project_services = rm.generate_projectid_itemized_report()
-    logger.debug("rm.generate_projectid_itemized_report() project_services:")
-    logger.debug(pprint.pformat(project_services, indent=4))
-    title, projectservice_totals_blocks = get_topn_projectservices_message_blocks(project_services, display_datetime, topn=PROJECTSERVICES_TOPN)
-    logger.debug("projectservice_totals_blocks:")
-    logger.debug(pprint.pformat(projectservice_totals_blocks, indent=4))
-    if post_to_slack:
-        logger.info("posting projectservice_totals_blocks to slack ...")
-        slack.post_message_to_channel(channel_name=SLACK_CHANNEL_NAME, message=title, blocks=projectservice_totals_blocks)
-        logger.info("posting projectservice_totals_blocks to slack ... DONE")
+    # fail the invocation once every report has been attempted
+    if failed:
+        raise ReportError(f"failed reports: {', '.join(failed)}") from next(iter(failed.values()))
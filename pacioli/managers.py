@@ -2,24 +2,91 @@
 Key class for interfacing with and obtaining data from the AWS CostExplorer API.
 """
 import datetime
+import gzip
+import hashlib
+import json
 import logging
+import os
 import pprint
+import tempfile
+import time
+import zlib
 from collections import Counter, defaultdict
 from operator import itemgetter
-from typing import List, Optional
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from .aws import CE_CLIENT
+from . import aws
 from .functions import get_accountid_mapping, get_month_starts, get_tag_display_mapping
-from .settings import GROUPBY_TAG_NAME
+from .settings import CE_RESPONSE_CACHE_DIRECTORY, CE_RESPONSE_CACHE_TTL_SECONDS, GROUPBY_TAG_NAME
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_EXCLUDE_TAGS = ["Tax"]
 
-
-def sort_by_periodstart(entry) -> datetime.datetime:
-    """Sort CostExplorer results by Period Start"""
-    return datetime.datetime.fromisoformat(entry["TimePeriod"]["Start"]).replace(tzinfo=datetime.timezone.utc)
+# CostExplorer TAG group keys are returned as "{TAG_NAME}${TAG_VALUE}"
+GROUPBY_TAG_KEY_PREFIX = f"{GROUPBY_TAG_NAME}$"
+
+TAX_FILTER = {"Dimensions": {"Key": "RECORD_TYPE", "Values": ["Tax"]}}
+EXCLUDE_TAX_FILTER = {"Not": TAX_FILTER}
+
+
+def _log_debug_pformat(message: str, value) -> None:
+    """Log the message and the pretty-printed value at DEBUG level, only formatting the value when DEBUG is enabled."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message)
+        logger.debug(pprint.pformat(value, indent=4))
+
+
+def get_cached_results_filepath(request: dict, cache_directory: str) -> Path:
+    """Get the content-addressed cache filepath for the given CostExplorer request."""
+    digest = hashlib.blake2b(json.dumps(request, sort_keys=True).encode("utf8"), digest_size=16).hexdigest()
+    return Path(cache_directory) / f"{digest}.json.gz"
+
+
+def load_cached_results(filepath: Path, ttl_seconds: int = CE_RESPONSE_CACHE_TTL_SECONDS) -> Optional[dict]:
+    """Load cached CostExplorer results if they exist and have not expired."""
+    try:
+        if time.time() - filepath.stat().st_mtime > ttl_seconds:
+            logger.info("cache expired: %s", filepath)
+            return None
+        with gzip.open(filepath, "rt", encoding="utf8") as cached:
+            results = json.load(cached)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, zlib.error, ValueError) as e:
+        # damaged (e.g. truncated) cache file, treat as a miss and remove it so it is rewritten
+        logger.exception(e)
+        logger.warning("unable to load cache, removing: %s", filepath)
+        filepath.unlink(missing_ok=True)
+        return None
+    if not isinstance(results, dict) or "ResultsByTime" not in results:
+        # readable, but not results written by save_cached_results(), treat as a miss
+        logger.warning("unexpected cache contents, removing: %s", filepath)
+        filepath.unlink(missing_ok=True)
+        return None
+    return results
+
+
+def save_cached_results(filepath: Path, results: dict) -> None:
+    """Write CostExplorer results to the cache."""
+    temp_filepath = None
+    try:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file in the same directory and move it into place,
+        # so an interrupted write never leaves a partial file at `filepath`
+        fd, temp_filepath = tempfile.mkstemp(dir=filepath.parent, suffix=".tmp")
+        os.close(fd)
+        with gzip.open(temp_filepath, "wt", encoding="utf8") as cached:
+            json.dump(results, cached)
+        os.replace(temp_filepath, filepath)
+        temp_filepath = None
+    except OSError as e:
+        logger.exception(e)
+        logger.warning("unable to write cache: %s", filepath)
+    finally:
+        if temp_filepath:
+            Path(temp_filepath).unlink(missing_ok=True)
 
 
 class CostManager:
@@ -27,46 +94,86 @@ class CostManager:
     Class intended to manage desired CostExplorer ('ce') operations.
     """
 
-    def _collect_account_cost(self, start: datetime.date, end: datetime.date, group_by: List[dict], granularity: str = "DAILY") -> dict:
-        logger.info(f"start={start}, end={end}, granularity={granularity}, group_by={group_by}")
-
-        all_results = {"ResultsByTime": []}
+    @staticmethod
+    def _iter_cost_and_usage_pages(request: dict) -> Iterator[dict]:
+        """
+        Yield each GetCostAndUsage response page, following NextPageToken.
 
-        response = CE_CLIENT.get_cost_and_usage(
-            TimePeriod={"Start": start.isoformat(), "End": end.isoformat()},
-            Granularity=granularity,
-            GroupBy=group_by,
-            Metrics=["UnblendedCost", "UsageQuantity"],
-        )
-        all_results["ResultsByTime"].extend(response["ResultsByTime"])
+        NOTE: botocore does not provide a paginator for the 'ce' GetCostAndUsage operation.
+        """
+        response = aws.CE_CLIENT.get_cost_and_usage(**request)
+        yield response
 
         # handle paged responses
-        while "NextPageToken" in response and response["NextPageToken"]:
-            response = CE_CLIENT.get_cost_and_usage(
-                TimePeriod={"Start": start.isoformat(), "End": end.isoformat()},
-                Granularity=granularity,
-                GroupBy=group_by,
-                Metrics=["UnblendedCost", "UsageQuantity"],
-                NextPageToken=response["NextPageToken"],
-            )
-            all_results["ResultsByTime"].extend(response["ResultsByTime"])
+        next_page_token = response.get("NextPageToken")
+        while next_page_token:
+            response = aws.CE_CLIENT.get_cost_and_usage(**request, NextPageToken=next_page_token)
+            yield response
+            next_page_token = response.get("NextPageToken")
+
+    def _iter_account_cost(
+        self, start: datetime.date, end: datetime.date, group_by: List[dict], granularity: str = "DAILY", filter_: Optional[dict] = None
+    ) -> Iterator[dict]:
+        """
+        Yield CostExplorer 'ResultsByTime' entries as each response page is received.
 
-        return all_results
+        `filter_` is passed to CostExplorer as the request 'Filter' expression.
+        """
+        logger.info("start=%s, end=%s, granularity=%s, group_by=%s, filter=%s", start, end, granularity, group_by, filter_)
+
+        request = {
+            "TimePeriod": {"Start": start.isoformat(), "End": end.isoformat()},
+            "Granularity": granularity,
+            "GroupBy": group_by,
+            "Metrics": ["UnblendedCost"],
+        }
+        if filter_:
+            request["Filter"] = filter_
+
+        cache_filepath = None
+        if CE_RESPONSE_CACHE_DIRECTORY:
+            cache_filepath = get_cached_results_filepath(request, CE_RESPONSE_CACHE_DIRECTORY)
+            cached_results = load_cached_results(cache_filepath)
+            if cached_results is not None:
+                logger.info("using cached results: %s", cache_filepath)
+                yield from cached_results["ResultsByTime"]
+                return
+
+        # only retain the received periods when they need to be written to the cache
+        results_by_time = []
+        for page in self._iter_cost_and_usage_pages(request):
+            if cache_filepath:
+                results_by_time.extend(page["ResultsByTime"])
+            yield from page["ResultsByTime"]
+
+        if cache_filepath:
+            save_cached_results(cache_filepath, {"ResultsByTime": results_by_time})
+
+    def _collect_account_cost(
+        self, start: datetime.date, end: datetime.date, group_by: List[dict], granularity: str = "DAILY", filter_: Optional[dict] = None
+    ) -> dict:
+        return {"ResultsByTime": list(self._iter_account_cost(start, end, group_by, granularity, filter_))}
 
-    def collect_account_service_metrics(self, start: datetime.date, end: datetime.date, granularity="DAILY") -> dict:
+    def iter_account_service_metrics(self, start: datetime.date, end: datetime.date, granularity="DAILY") -> Iterator[dict]:
         """
-        Collect account/service metrics.
+        Iterate account/service metrics by period as they are received.
         """
         group_by = [
             {"Type": "DIMENSION", "Key": "LINKED_ACCOUNT"},
         ]
-        return self._collect_account_cost(start, end, group_by, granularity)
+        return self._iter_account_cost(start, end, group_by, granularity)
 
-    def collect_groupbytag_service_metrics(
-        self, start: datetime.date, end: datetime.date, granularity="DAILY", include_services: bool = True
-    ) -> dict:
+    def collect_account_service_metrics(self, start: datetime.date, end: datetime.date, granularity="DAILY") -> dict:
         """
-        Collect tag/service metrics.
+        Collect account/service metrics.
+        """
+        return {"ResultsByTime": list(self.iter_account_service_metrics(start, end, granularity))}
+
+    def iter_groupbytag_service_metrics(
+        self, start: datetime.date, end: datetime.date, granularity="DAILY", include_services: bool = True, filter_: Optional[dict] = None
+    ) -> Iterator[dict]:
+        """
+        Iterate tag/service metrics by period as they are received.
         """
         group_by = [
             {"Type": "TAG", "Key": GROUPBY_TAG_NAME},
@@ -77,24 +184,30 @@ class CostManager:
             # -- May want to create a new function to breakdown "EC2 - Other" only costs.
             # {"Type": "DIMENSION", "Key": "USAGE_TYPE"}
             group_by.append({"Type": "DIMENSION", "Key": "SERVICE"})
-        return self._collect_account_cost(start, end, group_by, granularity)
+        return self._iter_account_cost(start, end, group_by, granularity, filter_)
+
+    def collect_groupbytag_service_metrics(
+        self, start: datetime.date, end: datetime.date, granularity="DAILY", include_services: bool = True
+    ) -> dict:
+        """
+        Collect tag/service metrics.
+        """
+        return {"ResultsByTime": list(self.iter_groupbytag_service_metrics(start, end, granularity, include_services))}
 
-    def get_period_total_tax(self, start: datetime.date, end: datetime.date) -> float:
+    def get_period_total_tax(self, start: datetime.date, end: datetime.date, granularity: str = "MONTHLY") -> float:
         """
         Get the total Tax cost for the given period.
         """
         group_by = [{"Type": "DIMENSION", "Key": "RECORD_TYPE"}]
-        daily_results = self._collect_account_cost(start, end, group_by, granularity="DAILY")
-        c = Counter()
-        for period in daily_results["ResultsByTime"]:
+        total = 0.0
+        for period in self._iter_account_cost(start, end, group_by, granularity=granularity, filter_=TAX_FILTER):
             for group in period["Groups"]:
-                key = "".join(group["Keys"])
-                if key == "Tax":
-                    amount = float(group["Metrics"]["UnblendedCost"]["Amount"])
-                    c[key] += amount
-        return c["Tax"]
+                # single GroupBy dimension, Keys is [RECORD_TYPE]
+                if group["Keys"][0] == "Tax":
+                    total += float(group["Metrics"]["UnblendedCost"]["Amount"])
+        return total
 
-    def get_projectid_totals(self, start: datetime.date, end: datetime.date) -> Counter:
+    def get_projectid_totals(self, start: datetime.date, end: datetime.date, granularity: str = "MONTHLY") -> Counter:
         """
         Sample Data:
 
@@ -155,17 +268,17 @@ class CostManager:
                     }
 
         """
-        daily_results = self.collect_groupbytag_service_metrics(start, end, include_services=False)
         c = Counter()
-        for period in daily_results["ResultsByTime"]:
+        for period in self.iter_groupbytag_service_metrics(start, end, granularity, include_services=False):
             for group in period["Groups"]:
                 key = "".join(group["Keys"])
                 amount = float(group["Metrics"]["UnblendedCost"]["Amount"])
                 c[key] += amount
         return c
 
-    def get_projectid_itemized_totals(self, start: datetime.date, end: datetime.date) -> dict:
+    def get_projectid_itemized_totals(self, start: datetime.date, end: datetime.date, granularity: str = "MONTHLY") -> dict:
         """
+        NOTE: Tax records are excluded by the CostExplorer request filter
         :return:
             {
                 "{PROJECT_ID}": {
@@ -175,27 +288,82 @@ class CostManager:
                 ...
             }
         """
-        daily_results = self.collect_groupbytag_service_metrics(start, end, include_services=True)
         c = defaultdict(Counter)
-        for period in daily_results["ResultsByTime"]:
+        for period in self.iter_groupbytag_service_metrics(start, end, granularity, include_services=True, filter_=EXCLUDE_TAX_FILTER):
             for group in period["Groups"]:
                 projectid, service = group["Keys"]
                 amount = float(group["Metrics"]["UnblendedCost"]["Amount"])
                 c[projectid][service] += amount
         return c
 
-    def get_account_totals(self, start: datetime.date, end: datetime.date) -> dict:
+    def get_account_totals(self, start: datetime.date, end: datetime.date, granularity: str = "MONTHLY") -> dict:
         """
         Get cost totals for all connected accounts.
         """
-        results = self.collect_account_service_metrics(start, end)
         c = Counter()
-        for period in results["ResultsByTime"]:
+        for period in self.iter_account_service_metrics(start, end, granularity):
             for group in period["Groups"]:
                 accountid = "".join(group["Keys"])
                 c[accountid] += float(group["Metrics"]["UnblendedCost"]["Amount"])
         return c
 
+    @staticmethod
+    def _get_month_to_date_cost(daily_costs: Dict[datetime.date, float], month_start: datetime.date, day: int) -> Optional[float]:
+        """Sum the daily costs from `month_start` through `day` of the same month, None if no costs were returned for that range."""
+        # walk the days of the range, so the sum is in day order regardless of the order periods were received in
+        dates = (month_start.replace(day=d) for d in range(1, day + 1))
+        amounts = [daily_costs[date] for date in dates if date in daily_costs]
+        if not amounts:
+            return None
+        return sum(amounts)
+
+    @classmethod
+    def _get_change(cls, daily_costs: Dict[str, Dict[datetime.date, float]], latest: datetime.date) -> dict:
+        """Compare the month-to-date cost through `latest` with the same period of the previous month for each key."""
+        current_month_start = latest.replace(day=1)
+        previous_month_end = current_month_start - datetime.timedelta(days=1)
+        previous_month_start = previous_month_end.replace(day=1)
+        # previous month may be shorter than the current month
+        previous_month_day = min(latest.day, previous_month_end.day)
+        change = {}
+        for key, costs in daily_costs.items():
+            current = cls._get_month_to_date_cost(costs, current_month_start, latest.day) or 0.0
+            previous = cls._get_month_to_date_cost(costs, previous_month_start, previous_month_day)
+            percentage_change = None
+            if previous:
+                percentage_change = round((current / previous - 1.0) * 100, 1)
+            change[key] = (current, previous, percentage_change)
+        return change
+
+    @staticmethod
+    def _get_daily_costs(
+        periods: Iterator[dict], most_recent_full_date: datetime.date
+    ) -> Tuple[Dict[str, Dict[datetime.date, float]], Optional[datetime.date]]:
+        """
+        Collect the daily cost of each group key and the latest day returned, up to `most_recent_full_date`.
+
+        :return:
+            (
+                {
+                    KEY: {DATE: COST, ...},
+                    ...
+                },
+                LATEST_DATE,
+            )
+        """
+        daily_costs = defaultdict(dict)
+        latest = None
+        for period in periods:
+            day = datetime.date.fromisoformat(period["TimePeriod"]["Start"])
+            if day > most_recent_full_date:
+                continue
+            for group in period["Groups"]:
+                key = "".join(group["Keys"])
+                daily_costs[key][day] = float(group["Metrics"]["UnblendedCost"]["Amount"])
+            if latest is None or day > latest:
+                latest = day
+        return daily_costs, latest
+
     def get_change_in_accounts(self, now: Optional[datetime.date] = None) -> dict:
         """
         :return:
@@ -215,76 +383,15 @@ class CostManager:
         start = previous_month_start
         end = most_recent_full_date
 
-        results = self.collect_account_service_metrics(start, end)
-        daily_cumsum = {}
-        earliest = None
-        latest = None
-        for period in results["ResultsByTime"]:
-            day = datetime.datetime.fromisoformat(period["TimePeriod"]["Start"]).replace(tzinfo=datetime.timezone.utc)
-            if day.date() > most_recent_full_date:
-                continue
-            for group in period["Groups"]:
-                account_id = "".join(group["Keys"])
-                if account_id not in daily_cumsum:
-                    daily_cumsum[account_id] = {}
-                if day.month not in daily_cumsum[account_id]:
-                    daily_cumsum[account_id][day.month] = {}
-                if day.day == 1:
-                    previous_total = 0
-                else:
-                    previous_total = daily_cumsum[account_id][day.month][day.day - 1]
-                daily_cumsum[account_id][day.month][day.day] = previous_total + float(group["Metrics"]["UnblendedCost"]["Amount"])
-            if not earliest:
-                earliest = day
-            elif day < earliest:
-                earliest = day
-            if not latest:
-                latest = day
-            elif day > latest:
-                latest = day
-        if latest.date() > most_recent_full_date:
-            latest = most_recent_full_date
-
-        logger.info(f"latest={latest}")
-        logger.debug("daily_cumsum:")
-        logger.debug(pprint.pformat(daily_cumsum, indent=4))
-        change = {}
-        for account_id in daily_cumsum.keys():
-            current = daily_cumsum[account_id][latest.month][latest.day]
-            previous_month_day = latest.day
-            if previous_month_day not in daily_cumsum[account_id][earliest.month]:
-                previous_month_day -= 1
-            previous = daily_cumsum[account_id][earliest.month][previous_month_day]
-            percentage_change = round((current / previous - 1.0) * 100, 1)
-            change[account_id] = (current, previous, percentage_change)
-        return change
-
-    @staticmethod
-    def _get_project_change(daily_cumsum: dict[dict], earliest_date: datetime.date, latest_date: datetime.date) -> dict:
-        """Get project change from 2 month daily cumulative sum dictionary."""
-        change = {}
-        for project_id in daily_cumsum.keys():
-            current = None
-            previous = None
-            percentage_change = None
+        periods = self.iter_account_service_metrics(start, end)
+        daily_costs, latest = self._get_daily_costs(periods, most_recent_full_date)
+        if latest is None:
+            logger.warning("no account costs returned for %s -> %s", start, end)
+            return {}
 
-            # get project current cost (find latest day)
-            latest_day = latest_date.day
-            while latest_day >= 1 and latest_day not in daily_cumsum[project_id][latest_date.month]:
-                latest_day -= 1
-
-            if latest_day >= 1:
-                current = daily_cumsum[project_id][latest_date.month][latest_day]
-                previous_month_day = latest_date.day
-                if earliest_date.month in daily_cumsum[project_id]:
-                    if previous_month_day not in daily_cumsum[project_id][earliest_date.month]:
-                        previous_month_day -= 1
-
-                    if previous_month_day in daily_cumsum[project_id][earliest_date.month]:
-                        previous = daily_cumsum[project_id][earliest_date.month][previous_month_day]
-                        percentage_change = round((current / previous - 1.0) * 100, 1)
-            change[project_id] = (current, previous, percentage_change)
-        return change
+        logger.info("latest=%s", latest)
+        _log_debug_pformat("daily_costs:", daily_costs)
+        return self._get_change(daily_costs, latest)
 
     def get_change_in_projects(self, now: Optional[datetime.date] = None) -> dict:
         """
@@ -301,34 +408,12 @@ class CostManager:
         start = previous_month_start
         end = most_recent_full_date
 
-        results = self.collect_groupbytag_service_metrics(start, end, include_services=False)
-        daily_cumsum = defaultdict(dict)
-        earliest = None
-        latest = None
-        for period in sorted(results["ResultsByTime"], key=sort_by_periodstart):
-            day = datetime.datetime.fromisoformat(period["TimePeriod"]["Start"]).replace(tzinfo=datetime.timezone.utc)
-            for group in period["Groups"]:
-                project_id = "".join(group["Keys"])
-                if day.month not in daily_cumsum[project_id]:
-                    daily_cumsum[project_id][day.month] = {}
-                if day.day == 1 or day.day - 1 not in daily_cumsum[project_id][day.month]:
-                    previous_total = 0
-                else:
-                    previous_total = daily_cumsum[project_id][day.month][day.day - 1]
-                daily_cumsum[project_id][day.month][day.day] = previous_total + float(group["Metrics"]["UnblendedCost"]["Amount"])
-            if not earliest:
-                earliest = day
-            elif day < earliest:
-                earliest = day
-            if not latest:
-                latest = day
-            elif day > latest:
-                latest = day
-
-        if latest.date() > most_recent_full_date:
-            latest = most_recent_full_date
-        change = self._get_project_change(daily_cumsum, earliest, latest)
-        return change
+        periods = self.iter_groupbytag_service_metrics(start, end, include_services=False)
+        daily_costs, latest = self._get_daily_costs(periods, most_recent_full_date)
+        if latest is None:
+            logger.warning("no project costs returned for %s -> %s", start, end)
+            return {}
+        return self._get_change(daily_costs, latest)
 
 
 class ReportManager:
@@ -350,10 +435,10 @@ class ReportManager:
             logger.info("dates not given, calculating...")
             most_recent_full_date, current_month_start, previous_month_start = get_month_starts(generation_datetime)
 
-        logger.info(f"generation_datetime={generation_datetime}")
-        logger.info(f"most_recent_full_date={most_recent_full_date}")
-        logger.info(f"current_month_start={current_month_start}")
-        logger.info(f"previous_month_start={previous_month_start}")
+        logger.info("generation_datetime=%s", generation_datetime)
+        logger.info("most_recent_full_date=%s", most_recent_full_date)
+        logger.info("current_month_start=%s", current_month_start)
+        logger.info("previous_month_start=%s", previous_month_start)
 
         self.generation_datetime = generation_datetime
         self.most_recent_full_date = most_recent_full_date
@@ -408,12 +493,15 @@ class ReportManager:
             ]
         """
         results = self.cm.get_change_in_projects(self.generation_datetime)
+        if not results:
+            # nothing to report, skip loading the tag display mapping
+            return []
 
         # reformat to expected output
         data = []
         id_mapping = get_tag_display_mapping()
         for project_id_raw, (current, previous, perc_change) in results.items():
-            project_id = project_id_raw.replace("ProjectId$", "").strip()
+            project_id = project_id_raw.removeprefix(GROUPBY_TAG_KEY_PREFIX).strip()
             name = id_mapping.get(project_id, "UNDEFINED")
             info = {"id": project_id, "name": name, "current_cost": current, "previous_cost": previous, "percentage_change": perc_change}
             data.append(info)
@@ -451,30 +539,25 @@ class ReportManager:
         #     ...
         # }
         # reformat to expected output
-        # aggregate project services
-        all_project_services = defaultdict(Counter)
+        data = []
+        id_mapping = get_tag_display_mapping()
         tax_service_name = "Tax"
         for project_id_raw, services in results.items():
+            project_id = project_id_raw.removeprefix(GROUPBY_TAG_KEY_PREFIX).strip()
+            name = id_mapping.get(project_id, "UNDEFINED")
+            current_cost = 0
+            project_services = []
             for service_name, cost in services.items():
                 # remove Tax
                 if service_name == tax_service_name:
-                    logger.info(f"excluding tag '{tax_service_name}' {cost}")
+                    logger.info("excluding tag '%s' %s", tax_service_name, cost)
                     continue
-                all_project_services[project_id_raw][service_name] += cost
-                all_project_services[project_id_raw]["current_cost"] += cost
-
-        data = []
-        id_mapping = get_tag_display_mapping()
-        for project_id_raw, services in results.items():
-            project_id = project_id_raw.replace("ProjectId$", "").strip()
-            name = id_mapping.get(project_id, "UNDEFINED")
-            info = {"id": project_id, "name": name, "current_cost": 0, "previous_cost": None, "services": []}
-            current_cost = all_project_services[project_id_raw].pop("current_cost", 0)
-            project_services = list(all_project_services[project_id_raw].items())
+                project_services.append((service_name, cost))
+                current_cost += cost
 
             # sort biggest -> smallest
-            info["services"] = sorted(project_services, key=lambda x: x[1], reverse=True)
-            info["current_cost"] = current_cost
+            project_services.sort(key=itemgetter(1), reverse=True)
+            info = {"id": project_id, "name": name, "current_cost": current_cost, "previous_cost": None, "services": project_services}
             data.append(info)
 
         return sorted(data, key=itemgetter("current_cost"), reverse=True)  # sort biggest -> smallest current cost
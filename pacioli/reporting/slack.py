@@ -14,11 +14,15 @@ class SlackPostManager:
 
     def __init__(self, token: str = settings.SLACK_TOKEN):
         self.sc = WebClient(token=token)
+        self._channel_ids = {}
 
     def _get_channel_id(self, channel_name: str):
         """
         Obtain the channel_id given the channel_name.
         """
+        if channel_name in self._channel_ids:
+            return self._channel_ids[channel_name]
+
         # get channel id for channel name
         channel_id = None
         channel_query_response = self.sc.conversations_list(exclude_archived=True)
@@ -29,6 +33,7 @@ class SlackPostManager:
         if not channel_id:
             raise SlackChannelError(f'"{channel_name}" not found!')
 
+        self._channel_ids[channel_name] = channel_id
         return channel_id
 
     def post_message_to_channel(
@@ -16,6 +16,8 @@ LOG_LEVEL = getattr(logging, RAW_LOG_LEVEL)
 
 GROUPBY_TAG_NAME = os.environ.get("GROUPBY_TAG_NAME", "ProjectId")
 GROUPBY_TAG_DISPLAY_MAPPING_S3_URI = os.getenv("GROUPBY_TAG_DISPLAY_MAPPING_S3_URI", None)
+DEFAULT_TAG_DISPLAY_MAPPING_CACHE_TTL_SECONDS = 60 * 60
+TAG_DISPLAY_MAPPING_CACHE_TTL_SECONDS = int(os.getenv("TAG_DISPLAY_MAPPING_CACHE_TTL_SECONDS", DEFAULT_TAG_DISPLAY_MAPPING_CACHE_TTL_SECONDS))
 
 DEFAULT_SLACK_CHANNEL_NAME = "cost_management"
 SLACK_CHANNEL_NAME = os.getenv("SLACK_CHANNEL_NAME", DEFAULT_SLACK_CHANNEL_NAME)
@@ -36,6 +38,11 @@ AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION", "us-west-2")
 DEFAULT_S3_SERVICE_ENDPOINT = f"https://s3.{AWS_DEFAULT_REGION}.amazonaws.com"
 AWS_SERVICE_ENDPOINTS = {"s3": os.getenv("S3_SERVICE_ENDPOINT", DEFAULT_S3_SERVICE_ENDPOINT)}
 
+# CostExplorer response cache (disabled when not set), ex: "/tmp/ce-cache"
+CE_RESPONSE_CACHE_DIRECTORY = os.getenv("CE_RESPONSE_CACHE_DIRECTORY", None)
+DEFAULT_CE_RESPONSE_CACHE_TTL_SECONDS = 24 * 60 * 60
+CE_RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("CE_RESPONSE_CACHE_TTL_SECONDS", DEFAULT_CE_RESPONSE_CACHE_TTL_SECONDS))
+
 DEFAULT_PROJECTSERVICES_TOPN = 10
 PROJECTSERVICES_TOPN = int(os.getenv("PROJECTSERVICES_TOPN", DEFAULT_PROJECTSERVICES_TOPN))
 
@@ -0,0 +1,14 @@
+from pacioli import aws
+from pacioli.aws import parse_s3_uri
+
+
+def test__parse_s3_uri():
+    assert parse_s3_uri("s3://bucket/key/filename.json") == ("bucket", "key/filename.json")
+    assert parse_s3_uri("s3://bucket/filename.json") == ("bucket", "filename.json")
+    assert parse_s3_uri("s3://bucket") == ("bucket", "")
+
+
+def test__ce_client_config():
+    config = aws.CE_CLIENT.meta.config
+    assert config.retries["mode"] == "adaptive"
+    assert config.max_pool_connections == 16
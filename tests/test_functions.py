@@ -2,15 +2,42 @@ import datetime
 import json
 from io import BytesIO
 from pathlib import Path
+from unittest import mock
+
+import pytest
+from botocore.exceptions import ClientError
 
 from pacioli.aws import S3_CLIENT
-from pacioli.functions import get_month_starts, get_tag_display_mapping
+from pacioli.functions import (
+    TAG_DISPLAY_MAPPING_CACHE,
+    datestr2datetime,
+    get_accounttotals_message_blocks,
+    get_month_starts,
+    get_projecttotals_message_blocks,
+    get_tag_display_mapping,
+    get_topn_projectservices_message_blocks,
+    load_accountid_mapping,
+)
 
 from .utils import reset_buckets
 
 TEST_DATA_DIRECTORY = Path(__file__).absolute().parent / "data"
 
 
+@pytest.fixture(autouse=True)
+def clear_tag_display_mapping_cache():
+    # mappings cached by one test must not be returned in another
+    TAG_DISPLAY_MAPPING_CACHE.clear()
+    yield
+    TAG_DISPLAY_MAPPING_CACHE.clear()
+
+
+def test__datestr2datetime():
+    expected = datetime.datetime(2022, 11, 7)
+    actual = datestr2datetime("2022-11-07")
+    assert actual == expected
+
+
 def test__get_month_starts():
     d = datetime.datetime(2019, 1, 5)
     expected_current_month_start = datetime.date(2019, 1, 1)
@@ -69,3 +96,86 @@ def test__get_tag_display_mapping__valid_key():
     for expected_key, expected_value in expected.items():
         assert expected_key in actual
         assert actual[expected_key] == expected_value
+
+
+def test__load_accountid_mapping(tmp_path):
+    expected = {"000000000001": "Account One"}
+    filepath = tmp_path / "accountid_mapping.json"
+    filepath.write_text(json.dumps(expected), encoding="utf8")
+    actual = load_accountid_mapping(filepath)
+    assert actual == expected
+
+
+def test__load_accountid_mapping__no_file(tmp_path):
+    actual = load_accountid_mapping(tmp_path / "accountid_mapping.json")
+    assert actual == {}
+
+
+def test__get_accounttotals_message_blocks__no_cost():
+    accounts = [{"id": "000000000001", "name": "Account One", "current_cost": 0.0, "previous_cost": 0.0, "percentage_change": 0.0}]
+    title, blocks = get_accounttotals_message_blocks(accounts)
+    assert title.endswith(" -")
+    assert blocks[2]["fields"][0]["text"] == "-"
+
+
+def test__get_accounttotals_message_blocks__no_previous_cost():
+    accounts = [{"id": "000000000001", "name": "Account One", "current_cost": 10.0, "previous_cost": 0.0, "percentage_change": None}]
+    _, blocks = get_accounttotals_message_blocks(accounts)
+    assert blocks[2]["text"]["text"] == "Account One (000000000001) -"
+
+
+def test__get_accounttotals_message_blocks__new_account():
+    accounts = [
+        {"id": "000000000002", "name": "Account Two", "current_cost": 4.0, "previous_cost": None, "percentage_change": None},
+        {"id": "000000000001", "name": "Account One", "current_cost": 3.0, "previous_cost": 2.0, "percentage_change": 50.0},
+    ]
+    title, blocks = get_accounttotals_message_blocks(accounts)
+    # account without a previous cost is excluded from the previous total: 7.0 / 2.0
+    assert title.endswith(" +250.0%")
+    assert blocks[2]["text"]["text"] == "Account Two (000000000002) -"
+
+
+def test__get_projecttotals_message_blocks__no_cost():
+    projects = [{"id": "123-456", "name": "OneTwoThree", "current_cost": 0.0, "previous_cost": None, "percentage_change": None}]
+    _, blocks = get_projecttotals_message_blocks(projects)
+    assert blocks[3]["fields"][0]["text"] == "-"
+
+
+def test__get_topn_projectservices_message_blocks__others():
+    services = [(f"Service {i}", 1.004) for i in range(12)]
+    project_services = [{"id": "123-456", "name": "OneTwoThree", "current_cost": 12.048, "services": services}]
+    _, blocks = get_topn_projectservices_message_blocks(project_services)
+    fields = blocks[2]["fields"]
+    assert len(fields) == 10
+    assert fields[-1]["text"] == "_Others $3.01_"
+
+
+def test__get_projecttotals_message_blocks__truncated():
+    projects = [
+        {"id": f"{i:03}", "name": f"Project {i}", "current_cost": float(100 - i), "previous_cost": None, "percentage_change": None} for i in range(30)
+    ]
+    _, blocks = get_projecttotals_message_blocks(projects)
+    assert len(blocks) == 50
+    assert blocks[-1]["type"] == "section"
+    assert blocks[-1]["text"]["text"].startswith("Project 23 ")
+
+
+def test__get_tag_display_mapping__cached():
+    s3_uri = "s3://test-mapping-bucket/cached.json"
+    expected = {"123-456": "OneTwoThree"}
+    contents = json.dumps(expected).encode("utf8")
+    not_modified = ClientError({"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject")
+    responses = [{"ETag": '"etag1"', "Body": BytesIO(contents)}, not_modified]
+    with mock.patch("pacioli.aws.S3_CLIENT.get_object", side_effect=responses) as mock_get_object:
+        assert get_tag_display_mapping(mapping_s3_uri=s3_uri) == expected
+        assert get_tag_display_mapping(mapping_s3_uri=s3_uri) == expected
+        assert mock_get_object.call_count == 1
+
+        # expired, object unchanged -- conditional GET returns 304
+        assert get_tag_display_mapping(mapping_s3_uri=s3_uri, ttl_seconds=0) == expected
+        assert mock_get_object.call_count == 2
+        assert mock_get_object.call_args.kwargs["IfNoneMatch"] == '"etag1"'
+
+    # expired, refresh fails -- previously retrieved mapping is used
+    with mock.patch("pacioli.aws.S3_CLIENT.get_object", side_effect=Exception("unavailable")):
+        assert get_tag_display_mapping(mapping_s3_uri=s3_uri, ttl_seconds=0) == expected
@@ -0,0 +1,24 @@
+import unittest
+from unittest import mock
+
+from pacioli.exceptions import ReportError
+from pacioli.handlers import events
+
+
+class PostStatusTestCase(unittest.TestCase):
+    @mock.patch("pacioli.handlers.events.get_topn_projectservices_message_blocks", return_value=("projectservice totals", []))
+    @mock.patch("pacioli.handlers.events.get_projecttotals_message_blocks", return_value=("project totals", []))
+    @mock.patch("pacioli.handlers.events.get_accounttotals_message_blocks", return_value=("account totals", []))
+    @mock.patch("pacioli.managers.ReportManager.generate_projectid_itemized_report", return_value=[])
+    @mock.patch("pacioli.managers.ReportManager.generate_projectid_report", return_value=[])
+    @mock.patch("pacioli.managers.ReportManager.get_period_total_tax", return_value=0.0)
+    @mock.patch("pacioli.managers.ReportManager.generate_accounts_report", side_effect=Exception("Throttled"))
+    def test__post_status__failed_report(self, *_):
+        with mock.patch.object(events.SLACK_POST_MANAGER, "post_message_to_channel") as mock_post_message_to_channel:
+            with self.assertRaises(ReportError) as context:
+                events.post_status({"post_to_slack": True}, None)
+        # the remaining reports are still posted before the invocation fails
+        actual = [call.kwargs["message"] for call in mock_post_message_to_channel.call_args_list]
+        self.assertEqual(actual, ["project totals", "projectservice totals"])
+        self.assertIn("account_totals", str(context.exception))
+        self.assertEqual(str(context.exception.__cause__), "Throttled")
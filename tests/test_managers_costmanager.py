@@ -1,8 +1,14 @@
 import datetime
+import gzip
+import os
+import tempfile
+import time
 import unittest
+from pathlib import Path
 from unittest import mock
 
-from pacioli.managers import CostManager
+from pacioli.managers import CostManager, load_cached_results
+from pacioli.settings import CE_RESPONSE_CACHE_TTL_SECONDS
 
 from .utils import (
     mock_collect_groupby_linkedaccount,
@@ -12,6 +18,11 @@ from .utils import (
 )
 
 
+def _period(start: str, costs: dict) -> dict:
+    groups = [{"Keys": [key], "Metrics": {"UnblendedCost": {"Amount": str(amount), "Unit": "USD"}}} for key, amount in costs.items()]
+    return {"TimePeriod": {"Start": start}, "Groups": groups}
+
+
 class CostManagerTestCase(unittest.TestCase):
     @mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=mock_collect_groupbytag_projectid())
     def test_get_projectid_totals(self, *_):
@@ -29,6 +40,20 @@ class CostManagerTestCase(unittest.TestCase):
         result = cm.get_period_total_tax(start, end)
         self.assertTrue(result)
 
+    @mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=mock_collect_groupby_resoucetype())
+    def test_get_period_total_tax__request(self, mock_get_cost_and_usage):
+        cm = CostManager()
+        cm.get_period_total_tax(datetime.date(2022, 11, 1), datetime.date(2022, 11, 14))
+        self.assertEqual(mock_get_cost_and_usage.call_args.kwargs["Granularity"], "MONTHLY")
+        self.assertEqual(mock_get_cost_and_usage.call_args.kwargs["Filter"], {"Dimensions": {"Key": "RECORD_TYPE", "Values": ["Tax"]}})
+
+    @mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=mock_collect_groupbytag_projectid_services())
+    def test_get_projectid_itemized_totals__excludes_tax(self, mock_get_cost_and_usage):
+        cm = CostManager()
+        cm.get_projectid_itemized_totals(datetime.date(2022, 11, 1), datetime.date(2022, 11, 14))
+        expected = {"Not": {"Dimensions": {"Key": "RECORD_TYPE", "Values": ["Tax"]}}}
+        self.assertEqual(mock_get_cost_and_usage.call_args.kwargs["Filter"], expected)
+
     @mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=mock_collect_groupbytag_projectid_services())
     def test_get_projectid_itemized_totals(self, *_):
         cm = CostManager()
@@ -58,3 +83,115 @@ class CostManagerTestCase(unittest.TestCase):
         cm = CostManager()
         result = cm.get_change_in_projects(now=now)
         self.assertTrue(result)
+
+    def test_get_change_in_projects__missing_days(self):
+        response = {
+            "ResultsByTime": [
+                _period("2022-10-01", {"ProjectId$a": 1.0}),
+                _period("2022-10-02", {"ProjectId$a": 1.0}),
+                _period("2022-11-01", {"ProjectId$a": 2.0}),
+                _period("2022-11-02", {"ProjectId$b": 5.0}),
+                _period("2022-11-03", {"ProjectId$a": 2.0, "ProjectId$b": 5.0}),
+            ]
+        }
+        now = datetime.datetime(2022, 11, 4, tzinfo=datetime.timezone.utc)
+        with mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=response):
+            result = CostManager().get_change_in_projects(now=now)
+        self.assertEqual(result["ProjectId$a"], (4.0, 2.0, 100.0))
+        self.assertEqual(result["ProjectId$b"], (10.0, None, None))
+
+    def test_get_change_in_accounts__shorter_previous_month(self):
+        february = [datetime.date(2023, 2, 1) + datetime.timedelta(days=i) for i in range(28)]
+        march = [datetime.date(2023, 3, 1) + datetime.timedelta(days=i) for i in range(31)]
+        response = {"ResultsByTime": [_period(day.isoformat(), {"000000000001": 1.0}) for day in february + march]}
+        now = datetime.datetime(2023, 4, 1, tzinfo=datetime.timezone.utc)
+        with mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=response):
+            result = CostManager().get_change_in_accounts(now=now)
+        # Mar 1-31 is compared with Feb 1-28
+        self.assertEqual(result["000000000001"], (31.0, 28.0, 10.7))
+
+    def test_get_change_in_accounts__no_previous_month(self):
+        response = {
+            "ResultsByTime": [
+                _period("2022-10-01", {"000000000001": 2.0}),
+                _period("2022-11-01", {"000000000001": 3.0, "000000000002": 4.0}),
+            ]
+        }
+        now = datetime.datetime(2022, 11, 2, tzinfo=datetime.timezone.utc)
+        with mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=response):
+            result = CostManager().get_change_in_accounts(now=now)
+        self.assertEqual(result["000000000001"], (3.0, 2.0, 50.0))
+        self.assertEqual(result["000000000002"], (4.0, None, None))
+
+    @mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value={"ResultsByTime": []})
+    def test_get_change__no_results(self, *_):
+        now = datetime.datetime(2022, 11, 15, tzinfo=datetime.timezone.utc)
+        cm = CostManager()
+        self.assertEqual(cm.get_change_in_accounts(now=now), {})
+        self.assertEqual(cm.get_change_in_projects(now=now), {})
+
+    @mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=mock_collect_groupby_linkedaccount())
+    def test__collect_account_cost__cached(self, mock_get_cost_and_usage):
+        start = datetime.date(2022, 10, 1)
+        end = datetime.date(2022, 11, 14)
+        group_by = [{"Type": "DIMENSION", "Key": "LINKED_ACCOUNT"}]
+        with tempfile.TemporaryDirectory() as cache_directory:
+            with mock.patch("pacioli.managers.CE_RESPONSE_CACHE_DIRECTORY", cache_directory):
+                cm = CostManager()
+                expected = cm._collect_account_cost(start, end, group_by)
+                actual = cm._collect_account_cost(start, end, group_by)
+        self.assertEqual(mock_get_cost_and_usage.call_count, 1)
+        self.assertEqual(actual, expected)
+
+    @mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=mock_collect_groupby_linkedaccount())
+    def test__collect_account_cost__cache_damaged(self, mock_get_cost_and_usage):
+        start = datetime.date(2022, 10, 1)
+        end = datetime.date(2022, 11, 14)
+        group_by = [{"Type": "DIMENSION", "Key": "LINKED_ACCOUNT"}]
+        damage = {
+            "truncated": lambda contents: contents[: len(contents) // 2],  # EOFError
+            "corrupted": lambda contents: contents[:10] + b"\x00" * (len(contents) - 10),  # zlib.error
+            "not a dict": lambda contents: gzip.compress(b"[]"),
+            "no ResultsByTime": lambda contents: gzip.compress(b'{"GroupDefinitions": []}'),
+        }
+        for name, damage_contents in damage.items():
+            with self.subTest(name), tempfile.TemporaryDirectory() as cache_directory:
+                mock_get_cost_and_usage.reset_mock()
+                with mock.patch("pacioli.managers.CE_RESPONSE_CACHE_DIRECTORY", cache_directory):
+                    expected = CostManager()._collect_account_cost(start, end, group_by)
+                    (cache_filepath,) = Path(cache_directory).glob("*.json.gz")
+                    cache_filepath.write_bytes(damage_contents(cache_filepath.read_bytes()))
+                    actual = CostManager()._collect_account_cost(start, end, group_by)
+                    # damaged file is replaced by a fresh copy
+                    self.assertEqual(load_cached_results(cache_filepath), expected)
+                self.assertEqual(mock_get_cost_and_usage.call_count, 2)
+                self.assertEqual(actual, expected)
+                self.assertEqual([p.name for p in Path(cache_directory).iterdir()], [cache_filepath.name])
+
+    @mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", return_value=mock_collect_groupby_linkedaccount())
+    def test__collect_account_cost__cache_expired(self, mock_get_cost_and_usage):
+        start = datetime.date(2022, 10, 1)
+        end = datetime.date(2022, 11, 14)
+        group_by = [{"Type": "DIMENSION", "Key": "LINKED_ACCOUNT"}]
+        with tempfile.TemporaryDirectory() as cache_directory:
+            with mock.patch("pacioli.managers.CE_RESPONSE_CACHE_DIRECTORY", cache_directory):
+                expected = CostManager()._collect_account_cost(start, end, group_by)
+                (cache_filepath,) = Path(cache_directory).glob("*.json.gz")
+                expired = time.time() - CE_RESPONSE_CACHE_TTL_SECONDS - 60
+                os.utime(cache_filepath, (expired, expired))
+                actual = CostManager()._collect_account_cost(start, end, group_by)
+        self.assertEqual(mock_get_cost_and_usage.call_count, 2)
+        self.assertEqual(actual, expected)
+
+    def test__collect_account_cost__paged(self):
+        first_page = mock_collect_groupby_linkedaccount()
+        first_page["NextPageToken"] = "token"
+        second_page = mock_collect_groupby_linkedaccount()
+        with mock.patch("pacioli.aws.CE_CLIENT.get_cost_and_usage", side_effect=[first_page, second_page]) as mock_get_cost_and_usage:
+            cm = CostManager()
+            group_by = [{"Type": "DIMENSION", "Key": "LINKED_ACCOUNT"}]
+            result = cm._collect_account_cost(datetime.date(2022, 10, 1), datetime.date(2022, 11, 14), group_by)
+        self.assertEqual(mock_get_cost_and_usage.call_count, 2)
+        self.assertEqual(mock_get_cost_and_usage.call_args.kwargs["NextPageToken"], "token")
+        expected = len(first_page["ResultsByTime"]) + len(second_page["ResultsByTime"])
+        self.assertEqual(len(result["ResultsByTime"]), expected)
@@ -0,0 +1,22 @@
+import unittest
+from unittest import mock
+
+from pacioli.exceptions import SlackChannelError
+from pacioli.reporting.slack import SlackPostManager
+
+CHANNELS_RESPONSE = {"channels": [{"name": "general", "id": "C0001"}, {"name": "cost_management", "id": "C0002"}]}
+
+
+class SlackPostManagerTestCase(unittest.TestCase):
+    @mock.patch("slack_sdk.WebClient.conversations_list", return_value=CHANNELS_RESPONSE)
+    def test__get_channel_id__cached(self, mock_conversations_list):
+        slack = SlackPostManager(token="xoxb-test")
+        self.assertEqual(slack._get_channel_id("cost_management"), "C0002")
+        self.assertEqual(slack._get_channel_id("cost_management"), "C0002")
+        self.assertEqual(mock_conversations_list.call_count, 1)
+
+    @mock.patch("slack_sdk.WebClient.conversations_list", return_value=CHANNELS_RESPONSE)
+    def test__get_channel_id__not_found(self, *_):
+        slack = SlackPostManager(token="xoxb-test")
+        with self.assertRaises(SlackChannelError):
+            slack._get_channel_id("unknown")